@@ -5,17 +5,58 @@
 
 from bs4 import BeautifulSoup
 import requests
+from requests.adapters import HTTPAdapter
 import json
-import plotly.graph_objs as go
 import sqlite3
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+from got_query import build_search_index
+from got_charts import export_dashboard
 
 DB_NAME = 'game_of_thrones.sqlite'
 #  Add baseurl for API of Ice and Fire
 baseurl_api = "https://anapioficeandfire.com/api/characters?"
+#  houses already fetched from the API, by url, so shared houses are fetched once
+HOUSE_DICT = {}
+
+#  IMDb series to crawl, by title ID
+GOT_TITLE_ID = 'tt0944947'
+SERIES_TITLE_IDS = [GOT_TITLE_ID]
+#  only these series have characters in the API of Ice and Fire
+ICE_AND_FIRE_TITLE_IDS = [GOT_TITLE_ID]
+
+#  SHARED CONNECTIONS - every crawl thread uses the same pool, cache and rate limit
+MAX_WORKERS = 8
+REQUEST_INTERVAL = 0.2 # seconds between two requests to the same host
+REQUEST_TIMEOUT = 30 # seconds before a stalled request is given up
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS))
+FETCH_POOL = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+RATE_LOCK = threading.Lock()
+NEXT_REQUEST_TIME = {}
+
+def wait_for_rate_limit(url):
+    ''' block until this thread may send a request to the host of url, so all
+    threads together send at most one request every REQUEST_INTERVAL per host
 
-#  CREATE CACHE
-CACHE_FILE_NAME = "got_cache.json"
-CACHE_DICT = {}
+    Parameters
+    ----------
+    url: string
+        the url about to be requested
+
+    Returns
+    -------
+    None
+    '''
+    host = urlparse(url).netloc
+    with RATE_LOCK:
+        now = time.monotonic()
+        start = max(now, NEXT_REQUEST_TIME.get(host, now))
+        NEXT_REQUEST_TIME[host] = start + REQUEST_INTERVAL
+    time.sleep(start - now)
 
 def construct_unique_key(baseurl, params):
     ''' constructs a key that is guaranteed to uniquely and
@@ -61,42 +102,72 @@ def make_request_with_api_cache(baseurl, params):
     '''
     request_key = construct_unique_key(baseurl, params)
 
-    if request_key in CACHE_DICT.keys():
+    cached = load_cache(CACHE_FILE_NAME, request_key)
+    if cached is not None:
         print("Using cache")
-        return CACHE_DICT[request_key]
-    else:
-        print("Fetching")
-        response = requests.get(baseurl, params)
-        CACHE_DICT[request_key] = response.json()
-        save_cache(CACHE_DICT)
-        return CACHE_DICT[request_key]
+        return json.loads(cached)
 
-def load_cache(): # called only once, when we run the program
-    try:
-        cache_file = open(CACHE_FILE_NAME, 'r')
-        cache_file_contents = cache_file.read()
-        cache = json.loads(cache_file_contents)
-        cache_file.close()
-    except:
-        cache = {}
-    return cache
+    print("Fetching")
+    wait_for_rate_limit(baseurl)
+    response = SESSION.get(baseurl, params=params, timeout=REQUEST_TIMEOUT)
+    result = response.json()
+    save_cache(CACHE_FILE_NAME, request_key, json.dumps(result))
+    return result
+
+def open_cache(cache):
+    ''' connect to the cache database, creating its table the first time
+    '''
+    conn = sqlite3.connect(cache, timeout=REQUEST_TIMEOUT)
+    # readers do not wait for the thread that is writing a page
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('CREATE TABLE IF NOT EXISTS "pages" ("Key" TEXT PRIMARY KEY, "Body" TEXT NOT NULL)')
+    return conn
+
+def load_cache(cache, key):
+    ''' the cached response for a url or API request key, None if it was
+    never fetched
+    '''
+    conn = open_cache(cache)
+    row = conn.execute('SELECT Body FROM pages WHERE Key = ?', [key]).fetchone()
+    conn.close()
+    if row is None:
+        return None
+    return row[0]
 
-def save_cache(cache): # called whenever the cache is changed
-    cache_file = open(CACHE_FILE_NAME, 'w')
-    contents_to_write = json.dumps(cache)
-    cache_file.write(contents_to_write)
-    cache_file.close()
+def save_cache(cache, key, body):
+    ''' store one response; only that row is written, so saving costs the
+    same however large the cache grows
+    '''
+    with CACHE_LOCK:
+        conn = open_cache(cache)
+        conn.execute('INSERT OR REPLACE INTO pages VALUES (?, ?)', [key, body])
+        conn.commit()
+        conn.close()
 
 def make_url_request_using_cache(url, cache, params=None):
-    if (url in cache.keys()): # the url is our unique key
-        print("Using cache")
-        return cache[url]     # we already have it, so return it
-    else:
-        print("Fetching")
-        response = requests.get(url) # gotta go get it
-        cache[url] = response.text # add the TEXT of the web page to the cache
-        save_cache(cache)          # write the cache to disk
-        return cache[url]          # return the text, which is now in the cache
+    # a re-crawl fetches every page again, once, so new ratings and casts show up
+    with CACHE_LOCK:
+        refetch = REFETCH_URLS is not None and url not in REFETCH_URLS
+    if not refetch:
+        page = load_cache(cache, url) # the url is our unique key
+        if page is not None:
+            print("Using cache")
+            return page     # we already have it, so return it
+
+    print("Fetching")
+    wait_for_rate_limit(url)
+    response = SESSION.get(url, timeout=REQUEST_TIMEOUT) # gotta go get it
+    save_cache(cache, url, response.text) # add the TEXT of the web page to the cache
+    with CACHE_LOCK:
+        if REFETCH_URLS is not None:
+            REFETCH_URLS.add(url)
+    return response.text
+
+#  CREATE CACHE - one row per page or API response in a SQLite file
+CACHE_FILE_NAME = "got_cache.sqlite"
+CACHE_LOCK = threading.Lock()
+#  during a re-crawl, the pages fetched again so far; None uses the cache as is
+REFETCH_URLS = None
 
 
 # PHASE 1 - ACCESSING IMDb
@@ -115,12 +186,13 @@ class EpisodeAttributes:
         return self.episode_number + " - " + self.season + ": '" + self.episode_name + "' is " + self.ep_length + " in length," + " rated " + self.rating + "/10 stars."
 
 
-def select_season():
-    ''' Make a dictionary of season #'s to their respective episodes list url from "https://www.imdb.com/title/tt0944947", the Game of Thrones home page
+def select_season(title_id=GOT_TITLE_ID):
+    ''' Make a dictionary of season #'s to their respective episodes list url from the IMDb home page of a series, e.g. "https://www.imdb.com/title/tt0944947" for Game of Thrones
 
     Parameters
     ----------
-    None
+    title_id: string
+        the IMDb title ID of the series
 
     Returns
     -------
@@ -129,47 +201,65 @@ def select_season():
         e.g. {'3': 'https://www.imdb.com/title/tt0944947/episodes?season=3', ...}
     '''
 
-    url = 'https://www.imdb.com/title/tt0944947/'
-    response = make_url_request_using_cache(url, load_cache())
+    url = f'https://www.imdb.com/title/{title_id}/'
+    response = make_url_request_using_cache(url, CACHE_FILE_NAME)
     soup = BeautifulSoup(response, 'html.parser')
 
-    keys = []
-    values = []
+    season_url_dict = {}
+    season_prefix = f'/title/{title_id}/episodes?season'
 
     baseurl = 'https://www.imdb.com'
     for div in soup.find_all('div', {'class': 'seasons-and-year-nav'}):
         for season_number in div.find_all('a'):
-            if season_number['href'][:32] == '/title/tt0944947/episodes?season':
+            if season_number['href'].startswith(season_prefix):
                 key = season_number.text.lower()
-                keys.append(int(key))
-                values.append(f"{baseurl}{season_number['href']}")
-                season_url_dict = dict(zip(keys, values))
+                if key.isnumeric():
+                    season_url_dict[int(key)] = f"{baseurl}{season_number['href']}"
 
-    l=list(season_url_dict.items())   #convert the given dict. into list
+    season_url_dict_ordered = dict(sorted(season_url_dict.items()))
 
-    l.sort()
-    l=list(season_url_dict.items())
-    l.sort(reverse=False) #sort in reverse order
+    return season_url_dict_ordered
 
-    season_url_dict_ordered=dict(l)
+def get_series_title(title_id=GOT_TITLE_ID):
+    ''' get the name of a series from its IMDb home page
 
-    return season_url_dict_ordered
+    Parameters
+    ----------
+    title_id: string
+        the IMDb title ID of the series
+
+    Returns
+    -------
+    string
+        the series name, or the title ID if the page has no heading
+    '''
+    url = f'https://www.imdb.com/title/{title_id}/'
+    response = make_url_request_using_cache(url, CACHE_FILE_NAME)
+    soup = BeautifulSoup(response, 'html.parser')
+
+    try:
+        title = soup.find('h1').text.strip()
+    except:
+        title = title_id
+
+    return title
 
 def make_episode_instance(season_url):
     '''
     '''
-    response = make_url_request_using_cache(season_url, load_cache())
+    response = make_url_request_using_cache(season_url, CACHE_FILE_NAME)
     soup = BeautifulSoup(response, 'html.parser')
 
+    # the heading reads 'Season 10 | Episode 1'
     try:
-        find_season = soup.find('div', class_='bp_heading').text.strip()
-        season = find_season[:8]
+        find_season = soup.find('div', class_='bp_heading').text.split('|')
+        season = ' '.join(find_season[0].split())
     except:
         season = "no season # found"
 
     try:
-        find_episode_number = soup.find('div', class_='bp_heading').text.strip()
-        episode_number = find_episode_number[11:]
+        find_episode_number = soup.find('div', class_='bp_heading').text.split('|')
+        episode_number = ' '.join(find_episode_number[1].split())
     except:
         episode_number = "no episode # found"
 
@@ -207,8 +297,8 @@ def get_episode_urls_for_season(season_url):
 
     episode_link_list = []
 
-    by_season = requests.get(season_url)
-    soup = BeautifulSoup(by_season.text, 'html.parser')
+    by_season = make_url_request_using_cache(season_url, CACHE_FILE_NAME)
+    soup = BeautifulSoup(by_season, 'html.parser')
 
     episode_by_season = soup.find_all("div", class_="list_item")
 
@@ -249,8 +339,8 @@ def format_episode_list(item_list):
 def view_characters_in_episode(episode_url):
     '''
     '''
-    response = requests.get(episode_url)
-    soup = BeautifulSoup(response.text, 'html.parser')
+    response = make_url_request_using_cache(episode_url, CACHE_FILE_NAME)
+    soup = BeautifulSoup(response, 'html.parser')
 
     character_names = []
 
@@ -290,9 +380,27 @@ def json_character(query):
     '''
     '''
     # note to self, it needs to be the full name, first names only will not work
-    response = requests.get(baseurl_api, params={'name': query}).json()
+    response = make_request_with_api_cache(baseurl_api, {'name': query})
     return response
 
+def get_house_info(url):
+    ''' get a house from the API of Ice and Fire, through the cache and only
+    once per run
+
+    Parameters
+    ----------
+    url: string
+        the house url listed in a character's allegiances
+
+    Returns
+    -------
+    dict
+        the house as returned by the API
+    '''
+    if url not in HOUSE_DICT:
+        HOUSE_DICT[url] = make_request_with_api_cache(url, {})
+    return HOUSE_DICT[url]
+
 def get_character_info(response):
     '''
     '''
@@ -300,10 +408,10 @@ def get_character_info(response):
 
     for x in response:
         character_dict['name'] = x.get('name')
-        character_dict['aliases'] = x.get('aliases')[:3]
+        character_dict['aliases'] = x.get('aliases')
         house_info = x.get('allegiances')
         for url in house_info:
-            y = requests.get(url).json()
+            y = get_house_info(url)
             character_dict['house'] = y.get('name')
             character_dict['words'] = y.get('words')
         character_dict['played by'] = x.get('playedBy')[0]
@@ -324,7 +432,7 @@ def format_character_dict(character_dict):
         played_by = ''
 
     try:
-        alias = character_dict['aliases']
+        alias = character_dict['aliases'][:3] # only the first few are shown
     except:
         alias = ''
 
@@ -362,132 +470,183 @@ def format_character_dict(character_dict):
 
     return f"{name} {act}{names}{home}{w}"
 
+def fetch_character(character_name, series_id=GOT_TITLE_ID):
+    ''' get a character's information from the API of Ice and Fire, or {} for
+    series the API does not cover
+    '''
+    if series_id not in ICE_AND_FIRE_TITLE_IDS:
+        return {}
+    return get_character_info(json_character(character_name))
 
-def check_character_exceptions():
-    ''' function to handle known errors between the API of Ice and Fire and IMDb
-    #  Cersei: Cersei the Lioness, The mother of madness
-    #  Ramsay has no listing
-    #  Tormund
-    #  Bran is listed under Brandon Stark and the 3 dictionary returned
-    Gregor 'The Mountain' Clegane"
-    Izembaro \n  \n  \n  (voice)
-    Sandor 'The Hound' Clegane
-    Yara Greyjoy
-    Maester Aemon
-    Ramsay 'Bolton'
-    # maester pycelle = pycelle
+def character_dict_from_row(row):
+    ''' rebuild the dictionary made by get_character_info from a characters row
+
+    Parameters
+    ----------
+    row: tuple
+        (ApiName, Aliases, PlayedBy, House, Words) from the characters table
+
+    Returns
+    -------
+    dict
+        the same keys get_character_info returns, or {} if the API had no
+        listing for the character
     '''
-    pass
+    api_name, aliases, played_by, house, words = row
+    character_dict = {}
 
-#  PLOTLY Functions
+    if api_name is None:
+        return character_dict
 
-def get_second_to_last_difference_plot():
+    character_dict['name'] = api_name
+    try:
+        alias = json.loads(aliases)
+    except:
+        alias = []
+    if alias != []:
+        character_dict['aliases'] = alias
+    character_dict['house'] = house
+    character_dict['words'] = words
+    character_dict['played by'] = played_by
+
+    return character_dict
+
+def save_character(cur, series_id, character_name, character_dict, first_episode_id=None):
+    ''' insert a character into the characters table
+
+    Parameters
+    ----------
+    cur: sqlite3.Cursor
+    series_id: string
+        the IMDb title ID of the series the character appears in
+    character_name: string
+        the name as credited on IMDb
+    character_dict: dict
+        as returned by get_character_info, {} if the API had no listing
+    first_episode_id: int
+        EpisodeId of the first appearance, None if unknown
+
+    Returns
+    -------
+    None
     '''
+    insert_char_sql = '''
+        INSERT INTO characters
+        VALUES (NULL, ?, ?, ?, ?, ?, ?, ?, ?)
     '''
-    z = select_season()
-    seasons_list = []
-
-    for seasons in z.values():
-        seasons_list.append(seasons)
 
-    # for k, v in z.items():
-    #     seasons = k
+    try:
+        act = character_dict['played by']
+    except:
+        act = ''
 
-    x1 = []
-    x2 = []
-    for a in seasons_list:
-        x = get_episode_urls_for_season(a)[-2:]
-        y = create_instances_from_url(x)
-        for items in y:
-            r = items.rating
-            x1.append(r)
-            x2.append(r)
-    second_ep = x1[0::2]
-    last_ep = x2[1::2]
+    try:
+        house = character_dict['house']
+    except:
+        house = ''
 
-    seasons=['Season 1', 'Season 2', 'Season 3', 'Season 4', 'Season 5', 'Season 6', 'Season 7', 'Season 8']
+    try:
+        words = character_dict['words']
+    except:
+        words = ''
 
-    fig = go.Figure(data=[
-        go.Bar(name='Penultimate Episode', x=seasons, y=second_ep),
-        go.Bar(name='Last Episode', x=seasons, y=last_ep)
+    try:
+        aliases = [a for a in character_dict['aliases'] if a != '']
+    except:
+        aliases = []
+
+    cur.execute(insert_char_sql, [
+        series_id, # series
+        character_dict.get('name'), # API name, NULL when not listed
+        character_name, # char name
+        json.dumps(aliases), # aliases
+        act, # played by
+        house, # house
+        words, # words
+        first_episode_id # foreign key
     ])
-    # Change the bar mode
-    fig.update_layout(barmode='group', title=f"Penultimate and Last Episode Rating of Game of Thrones by Season", xaxis_title="Season", yaxis_title="Rating")
 
-    return fig.show()
+def lookup_character(character_name, series_id=GOT_TITLE_ID):
+    ''' get a character's information from the database, only calling the API
+    of Ice and Fire for characters that are not stored yet and saving the result
 
-def get_average_season_rating():
+    Parameters
+    ----------
+    character_name: string
+        the name as credited on IMDb
+    series_id: string
+        the IMDb title ID of the series
+
+    Returns
+    -------
+    dict
+        the same keys get_character_info returns, ready for format_character_dict
     '''
+    select_char_sql = '''
+        SELECT ApiName, Aliases, PlayedBy, House, Words
+        FROM characters
+        WHERE SeriesId = ? AND CharacterName = ? COLLATE NOCASE
     '''
-    z = select_season()
-
-    seasons_list = []
 
-    seasons_graph=['Season 1', 'Season 2', 'Season 3', 'Season 4', 'Season 5', 'Season 6', 'Season 7', 'Season 8']
-    # for k, v in z.items():
-    #     seasons_graph = k
+    conn = sqlite3.connect(DB_NAME)
+    cur = conn.cursor()
 
-    for seasons in z.values():
-        seasons_list.append(seasons)
+    try:
+        row = cur.execute(select_char_sql, [series_id, character_name]).fetchone()
+    except sqlite3.OperationalError: # no database built yet
+        conn.close()
+        return fetch_character(character_name, series_id)
 
-    season_ratings = []
-    avg_season_rating = []
+    if row is not None:
+        conn.close()
+        return character_dict_from_row(row)
 
-    for a in seasons_list:
-        x = get_episode_urls_for_season(a)
-        y = create_instances_from_url(x)
-        sum_list = []
-        season_ratings.append(sum_list)
-        for items in y:
-            r = float(items.rating)
-            sum_list.append(r)
+    character_dict = fetch_character(character_name, series_id)
+    save_character(cur, series_id, character_name, character_dict)
+    conn.commit()
+    conn.close()
 
-    for indiv in season_ratings:
-        sums = 0
-        for ele in indiv:
-            sums += ele
-        res = sums / len(indiv)
-        avg_season_rating.append(round(res, 1))
+    return character_dict
 
-    scatter_data = go.Scatter(x=seasons_graph, y=avg_season_rating)
-    basic_layout = go.Layout(title=f"Average Episode Rating per Season", xaxis_title="Season Number", yaxis_title="Average Rating")
-    fig = go.Figure(data=scatter_data, layout=basic_layout)
 
-    return fig.show()
+def check_character_exceptions():
+    ''' function to handle known errors between the API of Ice and Fire and IMDb
+    #  Cersei: Cersei the Lioness, The mother of madness
+    #  Ramsay has no listing
+    #  Tormund
+    #  Bran is listed under Brandon Stark and the 3 dictionary returned
+    Gregor 'The Mountain' Clegane"
+    Izembaro \n  \n  \n  (voice)
+    Sandor 'The Hound' Clegane
+    Yara Greyjoy
+    Maester Aemon
+    Ramsay 'Bolton'
+    # maester pycelle = pycelle
+    '''
+    pass
 
 #  Create Database
 
 # get foreign key ready
-def get_ep_first_appearance():
+def get_ep_first_appearance(episode_casts):
     ''' get the episode of first (or maybe last?) appearance
-    '''
-    count = 0
-
-    count_dict = {}
-
-    z = select_season()
-    seasons_list = []
-    episode_list = []
 
-    for seasons in z.values():
-        seasons_list.append(seasons)
-
-    for a in seasons_list:
-        x = get_episode_urls_for_season(a)
-        for items in x:
-            episode_list.append(items)
-    for item in episode_list:
-        count += 1
-        count_dict[count] = item
+    Parameters
+    ----------
+    episode_casts: dict
+        key is the EpisodeId and value is the list of character names, in
+        broadcast order
 
-    all_characters = []
+    Returns
+    -------
+    dict
+        key is the character name and value is the EpisodeId
+    '''
     character_appearance_dict = {}
 
-    for k, v in count_dict.items():
-        g = view_characters_in_episode(v)
+    for k, g in episode_casts.items():
         for q in g:
-            if q not in all_characters:
-                all_characters.append(q)
+            if q not in character_appearance_dict:
                 character_appearance_dict[q] = k
 
     return character_appearance_dict
@@ -496,96 +655,195 @@ def create_db():
     conn = sqlite3.connect(DB_NAME)
     cur = conn.cursor()
 
+    drop_series_sql = 'DROP TABLE IF EXISTS "series"'
     drop_episodes_sql = 'DROP TABLE IF EXISTS "episodes"'
     drop_characters_sql = 'DROP TABLE IF EXISTS "characters"'
+    drop_appearances_sql = 'DROP TABLE IF EXISTS "appearances"'
+
+    create_series_sql = '''CREATE TABLE IF NOT EXISTS "series" ('SeriesId' TEXT PRIMARY KEY, 'Title' TEXT NOT NULL)'''
+
+    create_episodes_sql = '''CREATE TABLE IF NOT EXISTS "episodes" ( 'EpisodeId' INTEGER PRIMARY KEY AUTOINCREMENT, 'SeriesId' TEXT NOT NULL, 'SeasonNumber' TEXT NOT NULL, 'EpisodeNumber' TEXT NOT NULL, 'EpisodeName' TEXT NOT NULL, 'Length' TEXT NOT NULL, 'Rating' TEXT NOT NULL)'''
+
+    create_characters_sql = '''CREATE TABLE IF NOT EXISTS "characters" ('CharacterId' INTEGER PRIMARY KEY AUTOINCREMENT, 'SeriesId' TEXT NOT NULL, 'ApiName' TEXT, 'CharacterName' TEXT, 'Aliases' TEXT, 'PlayedBy' TEXT, 'House' TEXT, 'Words' TEXT, 'FirstEpisodeId' INTEGER)'''
 
-    create_episodes_sql = '''CREATE TABLE IF NOT EXISTS "episodes" ( 'EpisodeId' INTEGER PRIMARY KEY AUTOINCREMENT, 'SeasonNumber' TEXT NOT NULL, 'EpisodeNumber' TEXT NOT NULL, 'EpisodeName' TEXT NOT NULL, 'Length' TEXT NOT NULL, 'Rating' TEXT NOT NULL)'''
+    create_appearances_sql = '''CREATE TABLE IF NOT EXISTS "appearances" ('EpisodeId' INTEGER NOT NULL, 'Billing' INTEGER NOT NULL, 'CharacterName' TEXT NOT NULL, PRIMARY KEY ('EpisodeId', 'Billing'))'''
 
-    create_characters_sql = '''CREATE TABLE IF NOT EXISTS "characters" ('CharacterId' INTEGER PRIMARY KEY AUTOINCREMENT,'CharacterName' TEXT, 'PlayedBy' TEXT, 'House' TEXT, 'Words' TEXT, 'FirstEpisodeId' INTEGER)'''
+    # indexes for the lookups done by got_query.py
+    create_indexes_sql = [
+        'CREATE INDEX IF NOT EXISTS "episodes_season" ON "episodes" ("SeriesId", "SeasonNumber")',
+        'CREATE INDEX IF NOT EXISTS "episodes_name" ON "episodes" ("EpisodeName" COLLATE NOCASE)',
+        'CREATE INDEX IF NOT EXISTS "characters_name" ON "characters" ("SeriesId", "CharacterName" COLLATE NOCASE)',
+        'CREATE INDEX IF NOT EXISTS "appearances_character" ON "appearances" ("CharacterName" COLLATE NOCASE)',
+    ]
 
+    cur.execute(drop_series_sql)
     cur.execute(drop_episodes_sql)
     cur.execute(drop_characters_sql)
+    cur.execute(drop_appearances_sql)
+    cur.execute(create_series_sql)
     cur.execute(create_characters_sql)
     cur.execute(create_episodes_sql)
+    cur.execute(create_appearances_sql)
+    for index_sql in create_indexes_sql:
+        cur.execute(index_sql)
     conn.commit()
     conn.close()
 
-def load_episode_sql():
-    '''assign the episode class to the table
+def crawl_episode(episode_url):
+    ''' get an episode's details and its credited characters
+    '''
+    return make_episode_instance(episode_url), view_characters_in_episode(episode_url)
+
+def crawl_character(character_name, series_id=GOT_TITLE_ID):
+    ''' fetch_character for a crawl: a character the API cannot answer for is
+    stored without details instead of failing the whole series
+    '''
+    try:
+        return fetch_character(character_name, series_id)
+    except Exception as e:
+        print(f"[Error] Could not fetch {character_name}: {e!r}")
+        return {}
+
+def crawl_series(title_id=GOT_TITLE_ID):
+    ''' scrape every episode of a series, and its characters from the API of
+    Ice and Fire when the API covers the series. Pages are fetched on the
+    shared FETCH_POOL so several series can be crawled at the same time.
+
+    Parameters
+    ----------
+    title_id: string
+        the IMDb title ID of the series
+
+    Returns
+    -------
+    dict
+        'title id', 'title', 'episodes' (a list of (EpisodeAttributes,
+        list of character names) in broadcast order) and 'characters'
+        (character name to the dict made by get_character_info)
+    '''
+    season_urls = list(select_season(title_id).values())
+
+    episode_urls = []
+    for urls in FETCH_POOL.map(get_episode_urls_for_season, season_urls):
+        episode_urls.extend(urls)
+
+    episodes = list(FETCH_POOL.map(crawl_episode, episode_urls))
+
+    names = []
+    for episode, cast in episodes:
+        for name in cast:
+            if name not in names:
+                names.append(name)
+    character_dicts = FETCH_POOL.map(crawl_character, names, [title_id] * len(names))
+
+    return {
+        'title id': title_id,
+        'title': get_series_title(title_id),
+        'episodes': episodes,
+        'characters': dict(zip(names, character_dicts)),
+    }
+
+def load_series_sql(crawl):
+    '''assign a crawled series, its episodes, casts and characters to the
+    tables, replacing what was stored for it before
     '''
 
     insert_ep_sql = '''
         INSERT INTO episodes
-        VALUES (NULL, ?, ?, ?, ?, ?)
+        VALUES (NULL, ?, ?, ?, ?, ?, ?)
     '''
 
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-
-    z = select_season()
-    seasons_list = []
+    insert_app_sql = '''
+        INSERT INTO appearances
+        VALUES (?, ?, ?)
+    '''
 
-    for seasons in z.values():
-        seasons_list.append(seasons)
+    title_id = crawl['title id']
 
-    for a in seasons_list:
-        x = get_episode_urls_for_season(a)
-        y = create_instances_from_url(x)
+    conn = sqlite3.connect(DB_NAME)
+    cur = conn.cursor()
 
-        for episode in y:
-            cur.execute(insert_ep_sql, [
-                episode.season, # Season
-                episode.episode_number, # Episode Number
-                episode.episode_name, # Episode Name
-                episode.ep_length, # Length
-                episode.rating, # Rating
+    cur.execute('DELETE FROM appearances WHERE EpisodeId IN (SELECT EpisodeId FROM episodes WHERE SeriesId = ?)', [title_id])
+    cur.execute('DELETE FROM episodes WHERE SeriesId = ?', [title_id])
+    cur.execute('DELETE FROM characters WHERE SeriesId = ?', [title_id])
+    cur.execute('INSERT OR REPLACE INTO series VALUES (?, ?)', [title_id, crawl['title']])
+
+    episode_casts = {}
+
+    for episode, cast in crawl['episodes']:
+        cur.execute(insert_ep_sql, [
+            title_id, # Series
+            episode.season, # Season
+            episode.episode_number, # Episode Number
+            episode.episode_name, # Episode Name
+            episode.ep_length, # Length
+            episode.rating, # Rating
+        ])
+        episode_id = cur.lastrowid
+        episode_casts[episode_id] = cast
+
+        for billing, name in enumerate(cast, start=1):
+            cur.execute(insert_app_sql, [
+                episode_id, # episode id
+                billing, # order on the IMDb cast list
+                name, # char name
             ])
 
+    for k, v in get_ep_first_appearance(episode_casts).items():
+        save_character(cur, title_id, k, crawl['characters'].get(k, {}), v)
+
     conn.commit()
     conn.close()
 
-def load_characters_sql():
-    '''assign characetr information to the table
-    '''
+def load_catalog(title_ids=SERIES_TITLE_IDS, max_workers=MAX_WORKERS, refetch=False):
+    ''' crawl several series at the same time and load each one into the
+    database as soon as its crawl finishes. All crawls share the connection
+    pool, the page cache and the rate limit.
 
-    insert_char_sql = '''
-        INSERT INTO characters
-        VALUES (NULL, ?, ?, ?, ?, ?)
+    Parameters
+    ----------
+    title_ids: list
+        IMDb title IDs, e.g. ['tt0944947']
+    max_workers: int
+        how many series are crawled at the same time
+    refetch: bool
+        fetch the IMDb pages again instead of reading them from the cache,
+        to pick up new episodes, ratings and casts of series already crawled
+
+    Returns
+    -------
+    tuple
+        the title IDs that were loaded, in the order they finished, and a
+        dict of the title IDs that failed with their error
     '''
+    global REFETCH_URLS
 
+    loaded = []
+    failed = {}
+    if refetch:
+        REFETCH_URLS = set()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as series_pool:
+            crawls = {series_pool.submit(crawl_series, title_id): title_id for title_id in title_ids}
+            for done in as_completed(crawls):
+                title_id = crawls[done]
+                try:
+                    load_series_sql(done.result())
+                    loaded.append(title_id)
+                except Exception as e: # one bad series must not stop the rest
+                    failed[title_id] = repr(e)
+                    print(f"[Error] Could not load {title_id}: {e!r}")
+    finally:
+        REFETCH_URLS = None
+        load_search_index_sql()
+
+    return loaded, failed
+
+def load_search_index_sql():
+    '''build the full-text search index over the loaded tables
+    '''
     conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-
-    f = get_ep_first_appearance()
-
-    for k, v in f.items():
-        almost = json_character(k)
-        done = get_character_info(almost)
-
-        try:
-            act = done['played by']
-        except:
-            act = ''
-
-        try:
-            house = done['house']
-        except:
-            house = ''
-
-        try:
-            words = done['words']
-        except:
-            words = ''
-
-        cur.execute(insert_char_sql, [
-            k, # char name
-            act, # played by
-            house, # house
-            words, # words
-            v # foreign key
-        ])
-
-    conn.commit()
+    build_search_index(conn)
     conn.close()
 
 
@@ -594,16 +852,23 @@ def load_characters_sql():
 if __name__ == "__main__":
 
     create_db()
-    load_episode_sql()
-    load_characters_sql()
+    loaded, failed = load_catalog(SERIES_TITLE_IDS)
+
+    # the prompts explore the first configured series
+    title_id = SERIES_TITLE_IDS[0]
+    if title_id not in loaded:
+        print(f"[Error] {title_id} could not be loaded, check your connection and try again")
+        exit(1)
+    series_title = get_series_title(title_id)
+    season_dict = select_season(title_id)
 
     count = 0
     test_list = []
 
     # test_count = 0
 
-    get_average_season_rating()
-    get_second_to_last_difference_plot()
+    dashboard = export_dashboard(title_id, db_name=DB_NAME)
+    print(f"Charts for {series_title} are in {os.path.abspath(dashboard)}")
 
     count += 1
     test_list.append(1)
@@ -614,48 +879,19 @@ if __name__ == "__main__":
 
         # test_count += 1
 
-            ask_season = input("Enter Season # (1-8) of Game of Thrones to view episodes (e.g. 1), or 'exit' \n")
+            ask_season = input(f"Enter Season # (1-{len(season_dict)}) of {series_title} to view episodes (e.g. 1), or 'exit' \n")
             # str(ask_season.lower()
             if ask_season == "exit":
                 exit()
 
             if ask_season.isnumeric():
-                for k, v in select_season().items():
+                for k, v in season_dict.items():
                     if ask_season.lower() == str(k):
                         print(f"\n------------------------------\nList of Episodes in Season {ask_season.capitalize()}\n------------------------------\n")
                         # x = get_episodes_for_season(v)
                         x = get_episode_urls_for_season(v)
                         y = create_instances_from_url(x)
-                        xlist = []
-                        ylist = []
-                        for items in y:
-                        #     print(items.episode_name)
-
-                            xvals = [items.episode_name][0]
-                            yvals = [items.rating][0]
-                            xlist.append(xvals)
-                            ylist.append(yvals)
-
-                        scatter_data = go.Scatter(x=xlist, y=ylist, mode='markers', marker={'symbol':'star', 'size': 30, 'color':'#FFD700'})
-                        basic_layout = go.Layout(title=f"Episode Ratings in Season {ask_season} of Game of Thrones", xaxis_title="Episode Name", yaxis_title="Rating")
-                        fig = go.Figure(data=scatter_data, layout=basic_layout)
-                        fig.show()
-
-                        char_season_count = []
-                        for eps in x:
-                            char_names = view_characters_in_episode(eps)
-                            for i in char_names:
-                                char_season_count.append(i)
-                        d = {x:char_season_count.count(x) for x in char_season_count}
-                        character_name, frequency_of_appearance = d.keys(), d.values()
-
-                        xvals = tuple(character_name)
-                        yvals = tuple(frequency_of_appearance)
-
-                        bar_data = go.Bar(x=xvals, y=yvals, marker_color='crimson')
-                        basic_layout = go.Layout(title=f"Frequency of Character Appearances in Season {ask_season}", xaxis_title="Character Name", yaxis_title="Number of Episodes")
-                        fig = go.Figure(data=bar_data, layout=basic_layout)
-                        fig.show()
+                        print(f"Charts for this season are in {os.path.abspath(dashboard)}#season-{k}\n")
 
                         format_episode_list(y)
                         test_list.append(2)
@@ -720,8 +956,7 @@ if __name__ == "__main__":
                     print('[Error] Invalid Input')
                 elif int(choose_character) in range(len(dany)+1):
                     print(f"\n--------------------------------\nInformation on {dany[int(choose_character) - 1]}\n--------------------------------\n* shows only first-billed characters per IMDb\n")
-                    arya = json_character(dany[int(choose_character)-1])
-                    jon = get_character_info(arya)
+                    jon = lookup_character(dany[int(choose_character)-1], title_id)
                     print(format_character_dict(jon))
                     print('\n')
                 else:
@@ -0,0 +1,301 @@
+# copev
+# Victoria Cope
+
+# Rating analytics over a columnar episode store
+# Episodes are kept as typed NumPy arrays (one per field) instead of the display
+# strings of EpisodeAttributes, so every statistic is a handful of array
+# operations no matter how many series are loaded.
+
+import re
+import sqlite3
+
+import numpy as np
+
+DB_NAME = 'game_of_thrones.sqlite'
+
+RUNTIME_PATTERN = re.compile(r'(?:(\d+)\s*h)?\s*(?:(\d+)\s*min)?')
+
+
+def parse_rating(rating):
+    ''' turn a scraped rating such as '9.2' into a float, NaN if there is none
+    '''
+    try:
+        return float(rating)
+    except (TypeError, ValueError):
+        return np.nan
+
+def parse_runtime(ep_length):
+    ''' turn a scraped length such as '57min' or '1h 8min' into minutes
+
+    Parameters
+    ----------
+    ep_length: string
+        the length as shown on IMDb
+
+    Returns
+    -------
+    float
+        the length in minutes, NaN if it could not be read
+    '''
+    match = RUNTIME_PATTERN.search(ep_length or '')
+    if match is None or not any(match.groups()):
+        return np.nan
+    hours, minutes = match.groups()
+    return int(hours or 0) * 60 + int(minutes or 0)
+
+def parse_number(label):
+    ''' turn 'Season 3' or 'Episode 10' into 3 or 10, 0 if there is no number
+    '''
+    digits = re.search(r'\d+', label or '')
+    if digits is None:
+        return 0
+    return int(digits.group())
+
+
+class EpisodeStore:
+    ''' Episodes of one or more series held column by column
+
+    Attributes
+    ----------
+    series_ids: list
+        IMDb title IDs; the series column holds indexes into this list
+    series, season, episode: numpy.ndarray
+        small integer columns
+    rating, runtime: numpy.ndarray
+        float32 columns, NaN where IMDb had no value; runtime is in minutes
+    episode_id: numpy.ndarray
+        the EpisodeId in the database, 0 for episodes that were never stored
+    name: numpy.ndarray
+        episode names (object array)
+
+    Rows are sorted by series, season and episode number.
+    '''
+
+    def __init__(self, series_ids, series, season, episode, rating, runtime, episode_id, name):
+        order = np.lexsort((episode, season, series))
+        self.series_ids = list(series_ids)
+        self.series = np.asarray(series, dtype=np.int32)[order]
+        self.season = np.asarray(season, dtype=np.int16)[order]
+        self.episode = np.asarray(episode, dtype=np.int16)[order]
+        self.rating = np.asarray(rating, dtype=np.float32)[order]
+        self.runtime = np.asarray(runtime, dtype=np.float32)[order]
+        self.episode_id = np.asarray(episode_id, dtype=np.int64)[order]
+        self.name = np.asarray(name, dtype=object)[order]
+
+    def __len__(self):
+        return len(self.rating)
+
+    @classmethod
+    def from_rows(cls, rows):
+        ''' build a store from (SeriesId, SeasonNumber, EpisodeNumber,
+        EpisodeName, Rating, Length, EpisodeId) rows as stored in the database
+        '''
+        rows = list(rows)
+        series_ids = sorted({row[0] for row in rows})
+        series_index = {series_id: i for i, series_id in enumerate(series_ids)}
+
+        return cls(
+            series_ids,
+            [series_index[row[0]] for row in rows],
+            [parse_number(row[1]) for row in rows],
+            [parse_number(row[2]) for row in rows],
+            [parse_rating(row[4]) for row in rows],
+            [parse_runtime(row[5]) for row in rows],
+            [row[6] or 0 for row in rows],
+            [row[3] for row in rows],
+        )
+
+    @classmethod
+    def from_conn(cls, conn, series=None):
+        ''' load the episodes stored in an open database
+
+        Parameters
+        ----------
+        conn: sqlite3.Connection
+        series: list
+            IMDb title IDs to load, or None for every series
+
+        Returns
+        -------
+        EpisodeStore
+        '''
+        episodes_sql = 'SELECT SeriesId, SeasonNumber, EpisodeNumber, EpisodeName, Rating, Length, EpisodeId FROM episodes'
+        params = []
+        if series is not None:
+            episodes_sql += f" WHERE SeriesId IN ({', '.join('?' for s in series)})"
+            params = list(series)
+
+        return cls.from_rows(tuple(row) for row in conn.execute(episodes_sql, params))
+
+    @classmethod
+    def from_db(cls, db_name=DB_NAME, series=None):
+        ''' load the episodes stored in the database file, see from_conn
+        '''
+        conn = sqlite3.connect(f'file:{db_name}?mode=ro', uri=True)
+        store = cls.from_conn(conn, series)
+        conn.close()
+        return store
+
+    def select(self, series_id):
+        ''' the row mask of one series
+        '''
+        if series_id not in self.series_ids:
+            return np.zeros(len(self), dtype=bool)
+        return self.series == self.series_ids.index(series_id)
+
+
+def group_bounds(keys):
+    ''' start index and size of each run of equal values in a sorted array
+    '''
+    if len(keys) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    sizes = np.diff(np.r_[starts, len(keys)])
+    return starts, sizes
+
+def season_keys(store):
+    return store.series.astype(np.int64) << 16 | store.season.astype(np.int64)
+
+def season_stats(store):
+    ''' mean, median, spread and range of the ratings of every season
+
+    Parameters
+    ----------
+    store: EpisodeStore
+
+    Returns
+    -------
+    dict
+        columns 'series', 'season', 'episodes', 'rated', 'mean', 'median',
+        'std', 'min' and 'max', one entry per season
+    '''
+    keys = season_keys(store)
+    starts, sizes = group_bounds(keys)
+    valid = ~np.isnan(store.rating)
+
+    # sort by rating inside each season, NaN ratings last
+    order = np.lexsort((store.rating, keys))
+    ratings = store.rating[order].astype(np.float64)
+    group = np.repeat(np.arange(len(starts)), sizes)
+
+    rated = np.bincount(group, weights=valid[order], minlength=len(starts)).astype(np.int64)
+    total = np.bincount(group, weights=np.where(np.isnan(ratings), 0, ratings), minlength=len(starts))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / rated
+        squares = np.where(np.isnan(ratings), 0, (ratings - mean[group]) ** 2)
+        std = np.sqrt(np.bincount(group, weights=squares, minlength=len(starts)) / rated)
+
+    has_rating = rated > 0
+    last = starts + np.maximum(rated, 1) - 1
+    low = starts + np.maximum(rated - 1, 0) // 2
+    high = starts + rated // 2
+    high = np.where(has_rating, high, starts)
+
+    return {
+        'series': [store.series_ids[i] for i in store.series[starts]],
+        'season': store.season[starts],
+        'episodes': sizes,
+        'rated': rated,
+        'mean': mean,
+        'median': np.where(has_rating, (ratings[low] + ratings[high]) / 2, np.nan),
+        'std': std,
+        'min': np.where(has_rating, ratings[starts], np.nan),
+        'max': np.where(has_rating, ratings[last], np.nan),
+    }
+
+def finale_deltas(store):
+    ''' ratings of the penultimate and last episode of every season
+
+    Parameters
+    ----------
+    store: EpisodeStore
+
+    Returns
+    -------
+    dict
+        columns 'series', 'season', 'penultimate', 'last' and 'delta'
+        (last minus penultimate), one entry per season with at least two
+        episodes
+    '''
+    starts, sizes = group_bounds(season_keys(store))
+    starts, sizes = starts[sizes >= 2], sizes[sizes >= 2]
+    last = starts + sizes - 1
+
+    return {
+        'series': [store.series_ids[i] for i in store.series[last]],
+        'season': store.season[last],
+        'penultimate': store.rating[last - 1],
+        'last': store.rating[last],
+        'delta': store.rating[last] - store.rating[last - 1],
+    }
+
+def rolling_trend(store, window=5):
+    ''' trailing mean rating over the last few episodes of each series, in
+    broadcast order; unrated episodes are skipped rather than counted as 0
+
+    Parameters
+    ----------
+    store: EpisodeStore
+    window: int
+        number of episodes in the window
+
+    Returns
+    -------
+    numpy.ndarray
+        one value per row of the store, NaN until a rated episode is seen
+
+    Raises
+    ------
+    ValueError
+        if window is less than 1
+    '''
+    if window < 1:
+        raise ValueError(f'window must be at least 1, not {window}')
+
+    valid = ~np.isnan(store.rating)
+    sums = np.r_[0, np.cumsum(np.where(valid, store.rating, 0), dtype=np.float64)]
+    counts = np.r_[0, np.cumsum(valid)]
+
+    starts, sizes = group_bounds(store.series)
+    series_start = np.repeat(starts, sizes)
+    end = np.arange(1, len(store) + 1)
+    begin = np.maximum(end - window, series_start)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (sums[end] - sums[begin]) / (counts[end] - counts[begin])
+
+def rating_runtime_correlation(store):
+    ''' Pearson correlation between episode rating and runtime for each series
+
+    Parameters
+    ----------
+    store: EpisodeStore
+
+    Returns
+    -------
+    dict
+        columns 'series', 'episodes' (pairs used) and 'r', NaN when a series
+        has fewer than two usable episodes or no variation
+    '''
+    both = ~np.isnan(store.rating) & ~np.isnan(store.runtime)
+    group = store.series[both]
+    x = store.runtime[both].astype(np.float64)
+    y = store.rating[both].astype(np.float64)
+    size = len(store.series_ids)
+
+    n = np.bincount(group, minlength=size).astype(np.float64)
+    sx = np.bincount(group, weights=x, minlength=size)
+    sy = np.bincount(group, weights=y, minlength=size)
+    sxx = np.bincount(group, weights=x * x, minlength=size)
+    syy = np.bincount(group, weights=y * y, minlength=size)
+    sxy = np.bincount(group, weights=x * y, minlength=size)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r = (n * sxy - sx * sy) / np.sqrt((n * sxx - sx ** 2) * (n * syy - sy ** 2))
+
+    return {
+        'series': list(store.series_ids),
+        'episodes': n.astype(np.int64),
+        'r': np.where(n >= 2, r, np.nan),
+    }
@@ -0,0 +1,350 @@
+# copev
+# Victoria Cope
+
+# Charts of the episodes in the database built by game_of_thrones_proj.py
+# Everything here reads the database and never the web, so the dashboard can
+# be rebuilt without importing the scraper or loading its page cache.
+
+import html
+import os
+import sqlite3
+from collections import Counter
+
+import numpy as np
+import plotly.offline
+import plotly.graph_objs as go
+
+from got_analytics import EpisodeStore, season_stats, finale_deltas, rolling_trend
+
+DB_NAME = 'game_of_thrones.sqlite'
+GOT_TITLE_ID = 'tt0944947'
+
+#  charts with more points than this are drawn with WebGL
+WEBGL_THRESHOLD = 1000
+#  characters shown in a frequency chart before the rest go into 'Other'
+TOP_CHARACTERS = 40
+
+def use_webgl(points):
+    ''' whether a figure with this many points in all its traces together
+    should be drawn with WebGL
+    '''
+    return points > WEBGL_THRESHOLD
+
+def make_scatter(x, y, webgl=False, **kwargs):
+    ''' a scatter trace, drawn with WebGL (Scattergl) when webgl is True; pass
+    use_webgl() of the whole figure so every trace in it switches together
+    '''
+    if webgl:
+        return go.Scattergl(x=x, y=y, **kwargs)
+    return go.Scatter(x=x, y=y, **kwargs)
+
+def build_second_to_last_difference_figure(title_id=GOT_TITLE_ID, store=None, db_name=DB_NAME):
+    ''' bar chart of the penultimate and last episode rating of every season
+
+    Parameters
+    ----------
+    title_id: string
+        the IMDb title ID of the series
+    store: EpisodeStore
+        episodes to plot, loaded from the database if None
+    db_name: string
+        path to the SQLite database
+
+    Returns
+    -------
+    plotly.graph_objs.Figure
+    '''
+    if store is None:
+        store = EpisodeStore.from_db(db_name, [title_id])
+
+    finales = finale_deltas(store)
+    in_series = [s == title_id for s in finales['series']]
+
+    seasons = [f'Season {k}' for k in finales['season'][in_series]]
+    second_ep = finales['penultimate'][in_series]
+    last_ep = finales['last'][in_series]
+
+    fig = go.Figure(data=[
+        go.Bar(name='Penultimate Episode', x=seasons, y=second_ep),
+        go.Bar(name='Last Episode', x=seasons, y=last_ep)
+    ])
+    # Change the bar mode
+    fig.update_layout(barmode='group', title=f"Penultimate and Last Episode Rating of {get_stored_series_title(title_id, db_name)} by Season", xaxis_title="Season", yaxis_title="Rating")
+
+    return fig
+
+def build_average_season_rating_figure(title_id=GOT_TITLE_ID, store=None, db_name=DB_NAME):
+    ''' line chart of the average episode rating of every season
+
+    Parameters
+    ----------
+    title_id: string
+        the IMDb title ID of the series
+    store: EpisodeStore
+        episodes to plot, loaded from the database if None
+    db_name: string
+        path to the SQLite database
+
+    Returns
+    -------
+    plotly.graph_objs.Figure
+    '''
+    if store is None:
+        store = EpisodeStore.from_db(db_name, [title_id])
+
+    stats = season_stats(store)
+    in_series = [s == title_id for s in stats['series']]
+
+    seasons_graph = [f'Season {k}' for k in stats['season'][in_series]]
+    avg_season_rating = stats['mean'][in_series].round(1)
+
+    scatter_data = make_scatter(seasons_graph, avg_season_rating, use_webgl(len(seasons_graph)))
+    basic_layout = go.Layout(title=f"Average Episode Rating per Season of {get_stored_series_title(title_id, db_name)}", xaxis_title="Season Number", yaxis_title="Average Rating")
+    fig = go.Figure(data=scatter_data, layout=basic_layout)
+
+    return fig
+
+def build_season_ratings_figure(season, title_id=GOT_TITLE_ID, store=None, db_name=DB_NAME):
+    ''' star chart of the rating of every episode in a season
+
+    Parameters
+    ----------
+    season: int
+        the season number
+    title_id: string
+        the IMDb title ID of the series
+    store: EpisodeStore
+        episodes to plot, loaded from the database if None
+    db_name: string
+        path to the SQLite database
+
+    Returns
+    -------
+    plotly.graph_objs.Figure
+    '''
+    if store is None:
+        store = EpisodeStore.from_db(db_name, [title_id])
+
+    in_season = store.select(title_id) & (store.season == season)
+    xlist = store.name[in_season]
+    ylist = store.rating[in_season]
+
+    scatter_data = make_scatter(xlist, ylist, use_webgl(len(xlist)), mode='markers', marker={'symbol':'star', 'size': 30, 'color':'#FFD700'})
+    basic_layout = go.Layout(title=f"Episode Ratings in Season {season} of {get_stored_series_title(title_id, db_name)}", xaxis_title="Episode Name", yaxis_title="Rating")
+    fig = go.Figure(data=scatter_data, layout=basic_layout)
+
+    return fig
+
+def get_stored_series_title(title_id=GOT_TITLE_ID, db_name=DB_NAME):
+    ''' the series name saved by load_series_sql, None if the series is not
+    stored; charts never scrape, so they can be drawn from the database alone
+    '''
+    try:
+        conn = sqlite3.connect(f'file:{db_name}?mode=ro', uri=True)
+        row = conn.execute('SELECT Title FROM series WHERE SeriesId = ?', [title_id]).fetchone()
+        conn.close()
+    except sqlite3.OperationalError: # no database built yet
+        row = None
+
+    if row is None:
+        return None
+    return row[0]
+
+def get_season_character_names(season, title_id=GOT_TITLE_ID, db_name=DB_NAME):
+    ''' every credit in a season from the database, one name per episode the
+    character is credited in, in broadcast and billing order
+    '''
+    names_sql = '''
+        SELECT a.CharacterName
+        FROM appearances a
+        JOIN episodes e ON e.EpisodeId = a.EpisodeId
+        WHERE e.SeriesId = ? AND e.SeasonNumber = ?
+        ORDER BY e.EpisodeId, a.Billing
+    '''
+
+    conn = sqlite3.connect(f'file:{db_name}?mode=ro', uri=True)
+    names = [row[0] for row in conn.execute(names_sql, [title_id, f'Season {season}'])]
+    conn.close()
+
+    return names
+
+def build_character_frequency_figure(season, char_season_count, top_n=TOP_CHARACTERS):
+    ''' bar chart of how many episodes of a season each character is in,
+    most frequent first
+
+    Parameters
+    ----------
+    season: int
+        the season number, for the title
+    char_season_count: list
+        one character name per credited appearance in the season
+    top_n: int
+        how many characters get their own bar; the appearances of the rest
+        are added up in one 'Other' bar. None shows every character
+
+    Returns
+    -------
+    plotly.graph_objs.Figure
+    '''
+    d = Counter(char_season_count)
+    top = d.most_common(top_n)
+
+    xvals = [name for name, frequency in top]
+    yvals = [frequency for name, frequency in top]
+
+    others = len(d) - len(top)
+    if others > 0:
+        xvals.append(f'Other ({others} characters)')
+        yvals.append(sum(d.values()) - sum(yvals))
+
+    bar_data = go.Bar(x=xvals, y=yvals, marker_color='crimson')
+    basic_layout = go.Layout(title=f"Frequency of Character Appearances in Season {season}", xaxis_title="Character Name", yaxis_title="Number of Episodes")
+    fig = go.Figure(data=bar_data, layout=basic_layout)
+
+    return fig
+
+def build_rating_trend_figure(store, window=5, db_name=DB_NAME):
+    ''' every episode rating of every series in the store in broadcast order,
+    with its rolling mean
+
+    Parameters
+    ----------
+    store: EpisodeStore
+    window: int
+        number of episodes in the rolling mean
+    db_name: string
+        path to the SQLite database, for the series names
+
+    Returns
+    -------
+    plotly.graph_objs.Figure
+    '''
+    trend = rolling_trend(store, window)
+    # a rating and a trend point per episode
+    webgl = use_webgl(2 * len(store))
+
+    fig = go.Figure()
+    for series_id in store.series_ids:
+        in_series = store.select(series_id)
+        x = np.arange(1, in_series.sum() + 1)
+        title = get_stored_series_title(series_id, db_name) or series_id
+        fig.add_trace(make_scatter(x, store.rating[in_series], webgl, mode='markers', name=f'{title} rating', text=store.name[in_series]))
+        fig.add_trace(make_scatter(x, trend[in_series], webgl, mode='lines', name=f'{title} {window}-episode mean'))
+
+    fig.update_layout(title="Episode Ratings in Broadcast Order", xaxis_title="Episode", yaxis_title="Rating")
+
+    return fig
+
+def get_second_to_last_difference_plot(title_id=GOT_TITLE_ID, store=None, db_name=DB_NAME):
+    '''
+    '''
+    return build_second_to_last_difference_figure(title_id, store, db_name).show()
+
+def get_average_season_rating(title_id=GOT_TITLE_ID, store=None, db_name=DB_NAME):
+    '''
+    '''
+    return build_average_season_rating_figure(title_id, store, db_name).show()
+
+#  DASHBOARD
+
+DASHBOARD_DIR = 'dashboard'
+
+DASHBOARD_TEMPLATE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<script src="{plotly_js}"></script>
+<style>body {{ font-family: sans-serif; margin: 2em; }} nav a {{ margin-right: 1em; }}</style>
+</head>
+<body>
+<h1>{title}</h1>
+<nav>{links}</nav>
+{sections}
+</body>
+</html>
+'''
+
+def write_plotly_js(directory=DASHBOARD_DIR):
+    ''' write the plotly.js bundle next to the dashboard, once per plotly version
+
+    Parameters
+    ----------
+    directory: string
+        the dashboard directory
+
+    Returns
+    -------
+    string
+        the bundle file name, relative to the directory
+    '''
+    file_name = f'plotly-{plotly.__version__}.min.js'
+    path = os.path.join(directory, file_name)
+    if not os.path.exists(path):
+        bundle = open(path, 'w', encoding='utf-8')
+        bundle.write(plotly.offline.get_plotlyjs())
+        bundle.close()
+    return file_name
+
+def export_dashboard(title_id=GOT_TITLE_ID, directory=DASHBOARD_DIR, store=None, db_name=DB_NAME):
+    ''' render every chart of a series from the database into one HTML page
+    that shares a single local plotly.js bundle, instead of a browser tab per
+    figure
+
+    Parameters
+    ----------
+    title_id: string
+        the IMDb title ID of the series
+    directory: string
+        where to write index.html and the plotly.js bundle
+    store: EpisodeStore
+        episodes to plot, loaded from the database if None
+    db_name: string
+        path to the SQLite database
+
+    Returns
+    -------
+    string
+        the path of the dashboard page
+
+    Raises
+    ------
+    ValueError
+        if the series is not in the database
+    '''
+    series_title = get_stored_series_title(title_id, db_name)
+    if series_title is None:
+        raise ValueError(f'{title_id} is not in the database')
+
+    if store is None:
+        store = EpisodeStore.from_db(db_name, [title_id])
+
+    os.makedirs(directory, exist_ok=True)
+    plotly_js = write_plotly_js(directory)
+
+    figures = [
+        ('average', 'Average Rating', build_average_season_rating_figure(title_id, store, db_name)),
+        ('finales', 'Finales', build_second_to_last_difference_figure(title_id, store, db_name)),
+        ('trend', 'Trend', build_rating_trend_figure(store, db_name=db_name)),
+    ]
+    for season in np.unique(store.season[store.select(title_id)]):
+        figures.append((f'season-{season}', f'Season {season}', build_season_ratings_figure(season, title_id, store, db_name)))
+        figures.append((f'characters-{season}', f'Season {season} Characters', build_character_frequency_figure(season, get_season_character_names(season, title_id, db_name))))
+
+    links = []
+    sections = []
+    for anchor, label, fig in figures:
+        links.append(f'<a href="#{anchor}">{html.escape(label)}</a>')
+        sections.append(f'<section id="{anchor}">{fig.to_html(full_html=False, include_plotlyjs=False)}</section>')
+
+    path = os.path.join(directory, 'index.html')
+    page = open(path, 'w', encoding='utf-8')
+    page.write(DASHBOARD_TEMPLATE.format(
+        title=html.escape(series_title),
+        plotly_js=plotly_js,
+        links='\n'.join(links),
+        sections='\n'.join(sections),
+    ))
+    page.close()
+
+    return path
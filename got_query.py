@@ -0,0 +1,535 @@
+# copev
+# Victoria Cope
+
+# Non-interactive queries against the database built by game_of_thrones_proj.py
+# Only the standard library is imported here so answers come back without
+# loading plotly or bs4; the 'build' command imports the scraper when needed.
+
+import argparse
+import csv
+import difflib
+import json
+import math
+import re
+import sqlite3
+import sys
+
+DB_NAME = 'game_of_thrones.sqlite'
+DEFAULT_SERIES = 'tt0944947' # Game of Thrones
+
+# bm25 weights for the search columns: series, kind, ref, name, aliases, details
+SEARCH_WEIGHTS = (0.0, 0.0, 0.0, 10.0, 5.0, 1.0)
+
+
+def connect_read_only(db_name=DB_NAME):
+    ''' open the database without the ability to change it
+
+    Parameters
+    ----------
+    db_name: string
+        path to the SQLite database
+
+    Returns
+    -------
+    sqlite3.Connection
+        a read-only connection whose rows can be read like dicts
+    '''
+    conn = sqlite3.connect(f'file:{db_name}?mode=ro', uri=True)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def rows_to_dicts(rows):
+    return [dict(row) for row in rows]
+
+def query_series(conn):
+    ''' list the series in the database with their episode counts
+    '''
+    series_sql = '''
+        SELECT s.SeriesId, s.Title, COUNT(e.EpisodeId) AS Episodes
+        FROM series s
+        LEFT JOIN episodes e ON e.SeriesId = s.SeriesId
+        GROUP BY s.SeriesId
+        ORDER BY s.Title
+    '''
+    return rows_to_dicts(conn.execute(series_sql))
+
+def query_episodes(conn, season=None, series=DEFAULT_SERIES):
+    ''' list the episodes of a series, optionally for a single season
+
+    Parameters
+    ----------
+    conn: sqlite3.Connection
+    season: int
+        season number, or None for every season
+    series: string
+        IMDb title ID of the series
+
+    Returns
+    -------
+    list
+        a list of episode dicts in broadcast order
+    '''
+    episodes_sql = 'SELECT * FROM episodes WHERE SeriesId = ?'
+    params = [series]
+    if season is not None:
+        episodes_sql += ' AND SeasonNumber = ?'
+        params.append(f'Season {season}')
+    episodes_sql += ' ORDER BY EpisodeId'
+    return rows_to_dicts(conn.execute(episodes_sql, params))
+
+def find_episode(conn, episode, series=DEFAULT_SERIES):
+    ''' find one episode of a series by its EpisodeId or by its name
+    '''
+    if str(episode).isnumeric():
+        row = conn.execute('SELECT * FROM episodes WHERE SeriesId = ? AND EpisodeId = ?', [series, int(episode)]).fetchone()
+    else:
+        row = conn.execute('SELECT * FROM episodes WHERE SeriesId = ? AND EpisodeName = ? COLLATE NOCASE', [series, episode]).fetchone()
+    if row is None:
+        return None
+    return dict(row)
+
+def query_cast(conn, episode, series=DEFAULT_SERIES):
+    ''' list the credited characters of an episode in billing order
+
+    Parameters
+    ----------
+    conn: sqlite3.Connection
+    episode: string
+        EpisodeId (e.g. '21') or episode name (e.g. 'The Rains of Castamere')
+    series: string
+        IMDb title ID of the series the episode belongs to
+
+    Returns
+    -------
+    list
+        a list of character dicts, or None if the series has no such episode
+    '''
+    found = find_episode(conn, episode, series)
+    if found is None:
+        return None
+
+    cast_sql = '''
+        SELECT a.Billing, a.CharacterName, c.PlayedBy, c.House
+        FROM appearances a
+        LEFT JOIN characters c ON c.SeriesId = ? AND c.CharacterName = a.CharacterName COLLATE NOCASE
+        WHERE a.EpisodeId = ?
+        ORDER BY a.Billing
+    '''
+    return rows_to_dicts(conn.execute(cast_sql, [found['SeriesId'], found['EpisodeId']]))
+
+def query_character(conn, name, series=DEFAULT_SERIES):
+    ''' get a character's details and the episodes they appear in
+
+    Parameters
+    ----------
+    conn: sqlite3.Connection
+    name: string
+        the character name as credited on IMDb, case-insensitive
+    series: string
+        IMDb title ID of the series
+
+    Returns
+    -------
+    dict
+        the character row plus an 'Episodes' list, or None if not found
+    '''
+    row = conn.execute('SELECT * FROM characters WHERE SeriesId = ? AND CharacterName = ? COLLATE NOCASE', [series, name]).fetchone()
+    if row is None:
+        return None
+
+    character = dict(row)
+    episodes_sql = '''
+        SELECT e.EpisodeId, e.SeasonNumber, e.EpisodeNumber, e.EpisodeName
+        FROM appearances a
+        JOIN episodes e ON e.EpisodeId = a.EpisodeId
+        WHERE e.SeriesId = ? AND a.CharacterName = ? COLLATE NOCASE
+        ORDER BY e.EpisodeId
+    '''
+    character['Episodes'] = rows_to_dicts(conn.execute(episodes_sql, [series, name]))
+    return character
+
+def query_stats(conn, top=10, series=DEFAULT_SERIES):
+    ''' aggregate numbers about a series
+
+    Parameters
+    ----------
+    conn: sqlite3.Connection
+    top: int
+        how many of the most frequently credited characters to include
+    series: string
+        IMDb title ID of the series
+
+    Returns
+    -------
+    dict
+        episode and character counts, per-season ratings and top characters
+    '''
+    stats = {}
+    stats['series'] = series
+    stats['episodes'] = conn.execute('SELECT COUNT(*) FROM episodes WHERE SeriesId = ?', [series]).fetchone()[0]
+    stats['characters'] = conn.execute('SELECT COUNT(*) FROM characters WHERE SeriesId = ?', [series]).fetchone()[0]
+
+    # ratings that could not be scraped are stored as text, so leave them out
+    seasons_sql = '''
+        SELECT SeasonNumber, COUNT(*) AS Episodes,
+            ROUND(AVG(CASE WHEN Rating GLOB '[0-9]*' THEN CAST(Rating AS REAL) END), 2) AS AverageRating
+        FROM episodes
+        WHERE SeriesId = ?
+        GROUP BY SeasonNumber
+        ORDER BY MIN(EpisodeId)
+    '''
+    stats['seasons'] = rows_to_dicts(conn.execute(seasons_sql, [series]))
+
+    top_sql = '''
+        SELECT a.CharacterName, COUNT(*) AS Episodes
+        FROM appearances a
+        JOIN episodes e ON e.EpisodeId = a.EpisodeId
+        WHERE e.SeriesId = ?
+        GROUP BY a.CharacterName
+        ORDER BY Episodes DESC, a.CharacterName
+        LIMIT ?
+    '''
+    stats['top characters'] = rows_to_dicts(conn.execute(top_sql, [series, top]))
+    return stats
+
+def build_search_index(conn):
+    ''' (re)build the FTS5 index over character names, aliases, houses and
+    their words, and episode titles
+
+    Parameters
+    ----------
+    conn: sqlite3.Connection
+        a writable connection to a database made by create_db()
+
+    Returns
+    -------
+    int
+        the number of rows indexed
+    '''
+    cur = conn.cursor()
+    cur.execute('DROP TABLE IF EXISTS "search_vocab"')
+    cur.execute('DROP TABLE IF EXISTS "search"')
+    cur.execute('''CREATE VIRTUAL TABLE "search" USING fts5(series UNINDEXED, kind UNINDEXED, ref UNINDEXED, name, aliases, details, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')''')
+    # one row per word in each indexed row, so spelling fixes can stay in a series
+    cur.execute('''CREATE VIRTUAL TABLE "search_vocab" USING fts5vocab("search", 'instance')''')
+
+    insert_search_sql = 'INSERT INTO search VALUES (?, ?, ?, ?, ?, ?)'
+    count = 0
+
+    for series, title in cur.execute('SELECT SeriesId, Title FROM series').fetchall():
+        conn.execute(insert_search_sql, [series, 'series', series, title, '', ''])
+        count += 1
+
+    for series, name, aliases, house, words in cur.execute('SELECT SeriesId, CharacterName, Aliases, House, Words FROM characters').fetchall():
+        try:
+            alias = ', '.join(json.loads(aliases))
+        except (TypeError, ValueError):
+            alias = ''
+        conn.execute(insert_search_sql, [series, 'character', name, name, alias, f'{house or ""} {words or ""}'.strip()])
+        count += 1
+
+    for series, house, words in cur.execute("SELECT SeriesId, House, MAX(Words) FROM characters WHERE House != '' GROUP BY SeriesId, House").fetchall():
+        conn.execute(insert_search_sql, [series, 'house', house, house, '', words or ''])
+        count += 1
+
+    for series, episode_id, season, number, name in cur.execute('SELECT SeriesId, EpisodeId, SeasonNumber, EpisodeNumber, EpisodeName FROM episodes').fetchall():
+        conn.execute(insert_search_sql, [series, 'episode', episode_id, name, '', f'{season} {number}'])
+        count += 1
+
+    cur.execute("INSERT INTO search(search) VALUES ('optimize')")
+    conn.commit()
+    return count
+
+def make_match_query(terms):
+    ''' turn words into an FTS5 query where every word is a prefix
+    '''
+    return ' '.join(f'"{t}"*' for t in terms)
+
+def correct_spelling(conn, terms, series=None):
+    ''' swap words that match nothing in the index of a series (None for every
+    series) for the closest indexed word starting with the same two letters
+    '''
+    vocab_sql = '''
+        SELECT DISTINCT v.term
+        FROM search_vocab v
+        JOIN search s ON s.rowid = v.doc
+        WHERE v.term >= ? AND v.term < ? AND (? IS NULL OR s.series = ?)
+    '''
+    corrected = []
+    for t in terms:
+        # only a range of the sorted term list is read, however large the index
+        start = t[:2]
+        vocab = [row[0] for row in conn.execute(vocab_sql, [start, start + '\uffff', series, series])]
+        if any(v.startswith(t) for v in vocab):
+            corrected.append(t)
+            continue
+        close = difflib.get_close_matches(t, vocab, n=1, cutoff=0.7)
+        if close:
+            corrected.append(close[0])
+        else:
+            corrected.append(t)
+    return corrected
+
+def query_search(conn, text, limit=10, series=DEFAULT_SERIES):
+    ''' search characters, aliases, houses and episodes ranked by relevance
+
+    Parameters
+    ----------
+    conn: sqlite3.Connection
+    text: string
+        words to look for; each one matches as a prefix (e.g. 'lann tyr')
+    limit: int
+        the maximum number of results
+    series: string
+        IMDb title ID of the series to search, or None for every series
+
+    Returns
+    -------
+    list
+        a list of dicts with the series and kind of the match, its reference
+        (title ID, character name, house name or EpisodeId), a highlighted
+        snippet and its score
+    '''
+    terms = re.findall(r'\w+', text.lower())
+    if not terms:
+        return []
+
+    search_sql = f'''
+        SELECT series, kind, ref, name,
+            snippet(search, -1, '[', ']', '...', 8) AS snippet,
+            ROUND(bm25(search, {', '.join(str(w) for w in SEARCH_WEIGHTS)}), 3) AS score
+        FROM search
+        WHERE (? IS NULL OR series = ?) AND search MATCH ?
+        ORDER BY score
+        LIMIT ?
+    '''
+    result = rows_to_dicts(conn.execute(search_sql, [series, series, make_match_query(terms), limit]))
+    if not result:
+        corrected = correct_spelling(conn, terms, series)
+        if corrected != terms:
+            result = rows_to_dicts(conn.execute(search_sql, [series, series, make_match_query(corrected), limit]))
+    return result
+
+def columns_to_rows(columns):
+    ''' turn a dict of equal-length columns (lists or NumPy arrays) into a
+    list of row dicts, with NaN written as None and floats rounded to 4 places
+    '''
+    names = list(columns.keys())
+    values = [list(v.tolist() if hasattr(v, 'tolist') else v) for v in columns.values()]
+    rows = []
+    for row in zip(*values):
+        rows.append({k: (None if math.isnan(v) else round(v, 4)) if isinstance(v, float) else v for k, v in zip(names, row)})
+    return rows
+
+def query_analytics(conn, series, window=5):
+    ''' rating analytics computed with NumPy (imported only when called)
+
+    Parameters
+    ----------
+    conn: sqlite3.Connection
+    series: list
+        IMDb title IDs, or None for every series
+    window: int
+        number of episodes in the rolling rating trend
+
+    Returns
+    -------
+    dict
+        'seasons' (mean, median, spread and range per season), 'finales'
+        (penultimate vs last episode), 'correlation' (rating vs runtime per
+        series) and 'trend' (rolling mean rating per episode)
+    '''
+    import got_analytics
+
+    store = got_analytics.EpisodeStore.from_conn(conn, series)
+    trend = {
+        'series': [store.series_ids[i] for i in store.series],
+        'season': store.season,
+        'episode': store.episode,
+        'rating': store.rating,
+        'trend': got_analytics.rolling_trend(store, window),
+    }
+    return {
+        'seasons': columns_to_rows(got_analytics.season_stats(store)),
+        'finales': columns_to_rows(got_analytics.finale_deltas(store)),
+        'correlation': columns_to_rows(got_analytics.rating_runtime_correlation(store)),
+        'trend': columns_to_rows(trend),
+    }
+
+def export_dashboard(series, db_name=DB_NAME):
+    ''' write the static chart dashboard of a series from the database;
+    raises ValueError if the series has not been built
+    '''
+    import got_charts
+
+    return {'dashboard': got_charts.export_dashboard(series, db_name=db_name)}
+
+def build_db(title_ids, append=False, db_name=DB_NAME, refetch=False):
+    ''' scrape IMDb and the API of Ice and Fire to (re)build the database
+
+    Parameters
+    ----------
+    title_ids: list
+        IMDb title IDs of the series to crawl at the same time
+    append: bool
+        keep the series already in the database instead of starting over
+    db_name: string
+        path to the SQLite database to write
+    refetch: bool
+        fetch the IMDb pages again instead of reading them from the page cache
+
+    Returns
+    -------
+    dict
+        the database path, the title IDs that were loaded and the ones
+        that failed with their error
+    '''
+    import game_of_thrones_proj as got
+
+    # the scraper writes to its module-level DB_NAME
+    got.DB_NAME = db_name
+    if not append:
+        got.create_db()
+    loaded, failed = got.load_catalog(title_ids, refetch=refetch)
+    return {'database': got.DB_NAME, 'series': loaded, 'failed': failed}
+
+def write_output(result, output_format='json', out=sys.stdout):
+    ''' print a query result as JSON or CSV
+
+    Parameters
+    ----------
+    result: list or dict
+        the query result
+    output_format: string
+        'json' or 'csv'; nested values are written as JSON inside the CSV cell
+    out: file
+        where to write
+
+    Returns
+    -------
+    None
+    '''
+    if output_format == 'json':
+        json.dump(result, out, indent=2)
+        out.write('\n')
+        return
+
+    if isinstance(result, dict):
+        result = [result]
+    if not result:
+        return
+
+    fields = []
+    for row in result:
+        for k in row.keys():
+            if k not in fields:
+                fields.append(k)
+
+    writer = csv.DictWriter(out, fieldnames=fields)
+    writer.writeheader()
+    for row in result:
+        writer.writerow({k: json.dumps(v) if isinstance(v, (list, dict)) else v for k, v in row.items()})
+
+def positive_int(text):
+    ''' argparse type for counts that must be at least 1
+    '''
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f'must be at least 1, not {value}')
+    return value
+
+def make_parser():
+    parser = argparse.ArgumentParser(description='Query the series database without the interactive prompts.')
+    parser.add_argument('--db', default=DB_NAME, help=f'path to the database (default {DB_NAME})')
+    parser.add_argument('--format', choices=['json', 'csv'], default='json', dest='output_format')
+    parser.add_argument('--series', default=DEFAULT_SERIES, help=f'IMDb title ID of the series (default {DEFAULT_SERIES})')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('series', help='list the series in the database')
+
+    episodes = commands.add_parser('episodes', help='list episodes')
+    episodes.add_argument('--season', type=int, help='only this season (e.g. 3)')
+
+    cast = commands.add_parser('cast', help='list the characters in an episode')
+    cast.add_argument('episode', help='EpisodeId or episode name')
+
+    character = commands.add_parser('character', help='show one character')
+    character.add_argument('name', help="e.g. 'Arya Stark'")
+
+    stats = commands.add_parser('stats', help='aggregate numbers about the series')
+    stats.add_argument('--top', type=int, default=10, help='number of top characters to list')
+
+    search = commands.add_parser('search', help='full-text search of characters, aliases, houses and episodes')
+    search.add_argument('text', nargs='+', help="e.g. 'kingslayer' or 'lann'")
+    search.add_argument('--limit', type=int, default=10)
+    search.add_argument('--all', action='store_true', help='every series instead of --series')
+
+    analytics = commands.add_parser('analytics', help='rating statistics per season, finales, trends and rating/runtime correlation')
+    analytics.add_argument('--all', action='store_true', help='every series instead of --series')
+    analytics.add_argument('--window', type=positive_int, default=5, help='episodes in the rolling trend')
+
+    commands.add_parser('dashboard', help='write every chart of --series into one static HTML page')
+    commands.add_parser('index', help='rebuild the search index of an existing database')
+    build = commands.add_parser('build', help='scrape the data and rebuild the database (slow)')
+    build.add_argument('title_ids', nargs='*', default=[DEFAULT_SERIES], help='IMDb title IDs to crawl at the same time')
+    build.add_argument('--append', action='store_true', help='add to the database instead of starting over')
+    build.add_argument('--refetch', action='store_true', help='fetch the pages again to pick up new episodes, ratings and casts')
+
+    return parser
+
+def run_query(conn, args):
+    ''' answer one of the read-only commands
+    '''
+    if args.command == 'series':
+        return query_series(conn)
+    if args.command == 'analytics':
+        return query_analytics(conn, None if args.all else [args.series], args.window)
+    if args.command == 'episodes':
+        return query_episodes(conn, args.season, args.series)
+    if args.command == 'cast':
+        return query_cast(conn, args.episode, args.series)
+    if args.command == 'character':
+        return query_character(conn, args.name, args.series)
+    if args.command == 'search':
+        return query_search(conn, ' '.join(args.text), args.limit, None if args.all else args.series)
+    return query_stats(conn, args.top, args.series)
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+
+    if args.command == 'build':
+        result = build_db(args.title_ids, args.append, args.db, args.refetch)
+        write_output(result, args.output_format)
+        return 1 if result['failed'] else 0
+
+    if args.command == 'dashboard':
+        try:
+            write_output(export_dashboard(args.series, args.db), args.output_format)
+        except ValueError as e:
+            print(f"[Error] {e}, run the 'build' command first", file=sys.stderr)
+            return 1
+        return 0
+
+    try:
+        if args.command == 'index':
+            # mode=rw so a wrong path is an error instead of a new empty file
+            conn = sqlite3.connect(f'file:{args.db}?mode=rw', uri=True)
+            result = {'indexed': build_search_index(conn)}
+        else:
+            conn = connect_read_only(args.db)
+            result = run_query(conn, args)
+    except sqlite3.OperationalError as e:
+        print(f"[Error] Could not read {args.db} ({e}), run the 'build' command first", file=sys.stderr)
+        return 1
+    conn.close()
+
+    if result is None:
+        print('[Error] Not found', file=sys.stderr)
+        return 1
+
+    write_output(result, args.output_format)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,338 @@
+# copev
+# Victoria Cope
+
+# Read-only HTTP service over the database built by game_of_thrones_proj.py
+# The database is copied into memory once and every request reads that copy;
+# a refresh builds a new copy in the background and swaps it in, so reads are
+# never blocked. Hot responses are kept in an LRU cache.
+
+import argparse
+import itertools
+import json
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import got_query
+
+CACHE_SIZE = 1024
+# names the in-memory copies so no two in this process collide
+SNAPSHOT_NAMES = itertools.count()
+
+
+class Snapshot:
+    ''' An in-memory copy of the database that any thread can read
+
+    The copy is a shared-cache memory database, so each request opens its own
+    connection to it and readers do not wait on each other. Requests acquire
+    the snapshot while they read it; once a refresh retires it, the copy is
+    dropped when the last of them releases it.
+    '''
+
+    def __init__(self, db_name, generation):
+        self.generation = generation
+        self.uri = f'file:got_snapshot_{next(SNAPSHOT_NAMES)}?mode=memory&cache=shared'
+        # keeps the memory database alive until the snapshot is retired and unused
+        self.keeper = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        source = got_query.connect_read_only(db_name)
+        source.backup(self.keeper)
+        source.close()
+        self.lock = threading.Lock()
+        self.users = 0
+        self.retired = False
+
+    def acquire(self):
+        ''' count a reader in; returns False if the copy is already gone
+        '''
+        with self.lock:
+            if self.keeper is None:
+                return False
+            self.users += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.users -= 1
+            if self.retired and self.users == 0:
+                self.close()
+
+    def retire(self):
+        ''' drop the copy as soon as no request is reading it
+        '''
+        with self.lock:
+            self.retired = True
+            if self.users == 0:
+                self.close()
+
+    def connect(self):
+        conn = sqlite3.connect(self.uri, uri=True)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA query_only = 1')
+        return conn
+
+    def close(self):
+        # called with the lock held
+        self.keeper.close()
+        self.keeper = None
+
+
+class ResponseCache:
+    ''' A thread-safe LRU cache of encoded responses
+    '''
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return self.items[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def stats(self):
+        with self.lock:
+            return {'size': len(self.items), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+def first(params, name, default=None):
+    return params.get(name, [default])[0]
+
+def route(conn, path, params):
+    ''' answer a GET request from a snapshot connection
+
+    Parameters
+    ----------
+    conn: sqlite3.Connection
+    path: list
+        the url path split on '/', e.g. ['cast', '21']
+    params: dict
+        the parsed query string
+
+    Returns
+    -------
+    list or dict
+        the JSON-ready result, or None if there is no such resource
+
+    Raises
+    ------
+    ValueError
+        if a parameter is not a number where one is expected
+    '''
+    series = first(params, 'series', got_query.DEFAULT_SERIES)
+
+    if path == ['series']:
+        return got_query.query_series(conn)
+    if path == ['episodes']:
+        season = first(params, 'season')
+        return got_query.query_episodes(conn, None if season is None else int(season), series)
+    if len(path) == 2 and path[0] == 'cast':
+        return got_query.query_cast(conn, path[1], series)
+    if len(path) == 2 and path[0] == 'characters':
+        return got_query.query_character(conn, path[1], series)
+    if path == ['stats']:
+        return got_query.query_stats(conn, int(first(params, 'top', 10)), series)
+    if path == ['search']:
+        return got_query.query_search(conn, first(params, 'q', ''), int(first(params, 'limit', 10)), None if series == 'all' else series)
+    if path == ['analytics']:
+        return got_query.query_analytics(conn, None if series == 'all' else [series], int(first(params, 'window', 5)))
+    return None
+
+
+class GotServer(ThreadingHTTPServer):
+    ''' Serves JSON from the current snapshot of the database
+
+    Parameters
+    ----------
+    address: tuple
+        (host, port) to listen on
+    db_name: string
+        path to the SQLite database
+    cache_size: int
+        how many responses the LRU cache keeps
+    '''
+
+    daemon_threads = True
+
+    def __init__(self, address, db_name=got_query.DB_NAME, cache_size=CACHE_SIZE):
+        super().__init__(address, GotRequestHandler)
+        self.db_name = db_name
+        self.cache = ResponseCache(cache_size)
+        self.snapshot = Snapshot(db_name, 0)
+        self.refresh_lock = threading.Lock()
+        self.refresh_error = None
+        self.verbose = False
+
+    def refreshing(self):
+        return self.refresh_lock.locked()
+
+    def acquire_snapshot(self):
+        ''' the current snapshot, held for the caller until it calls release()
+        '''
+        while True:
+            snapshot = self.snapshot
+            # fails only if a refresh retired it in between, so take the new one
+            if snapshot.acquire():
+                return snapshot
+
+    def start_refresh(self, title_ids=None):
+        ''' reload the database in a background thread, crawling the given
+        series into it first; returns False if a refresh is already running
+        '''
+        if not self.refresh_lock.acquire(blocking=False):
+            return False
+        threading.Thread(target=self.refresh, args=(title_ids,), daemon=True).start()
+        return True
+
+    def refresh(self, title_ids=None):
+        try:
+            if title_ids:
+                import game_of_thrones_proj as got
+
+                # the scraper writes to its module-level DB_NAME
+                got.DB_NAME = self.db_name
+                # pages are fetched again, or series already crawled would never change
+                loaded, failed = got.load_catalog(title_ids, refetch=True)
+            else:
+                failed = {}
+
+            snapshot = Snapshot(self.db_name, self.snapshot.generation + 1)
+            previous, self.snapshot = self.snapshot, snapshot
+            self.cache.clear()
+            # requests still reading the old copy keep it until they finish
+            previous.retire()
+            self.refresh_error = failed or None
+        except Exception as e:
+            self.refresh_error = repr(e)
+        finally:
+            self.refresh_lock.release()
+
+    def status(self):
+        return {
+            'database': self.db_name,
+            'generation': self.snapshot.generation,
+            'refreshing': self.refreshing(),
+            'refresh error': self.refresh_error,
+            'cache': self.cache.stats(),
+        }
+
+
+class GotRequestHandler(BaseHTTPRequestHandler):
+
+    def send_json(self, code, body):
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, code, message):
+        self.send_json(code, json.dumps({'error': message}).encode())
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = [unquote(p) for p in url.path.split('/') if p != '']
+
+        if path == ['status']:
+            self.send_json(200, json.dumps(self.server.status()).encode())
+            return
+
+        snapshot = self.server.acquire_snapshot()
+        try:
+            key = (snapshot.generation, self.path)
+            body = self.server.cache.get(key)
+            if body is None:
+                conn = snapshot.connect()
+                try:
+                    result = route(conn, path, parse_qs(url.query))
+                finally:
+                    conn.close()
+                if result is not None:
+                    body = json.dumps(result).encode()
+                    # a refresh may have cleared the cache since this request began
+                    if snapshot is self.server.snapshot:
+                        self.server.cache.put(key, body)
+        except ValueError:
+            self.send_error_json(400, 'Bad parameter')
+            return
+        except sqlite3.Error as e:
+            self.log_error('database error on %s: %r', self.path, e)
+            self.send_error_json(500, 'Database error')
+            return
+        except Exception as e:
+            self.log_error('error on %s: %r', self.path, e)
+            self.send_error_json(500, 'Internal error')
+            return
+        finally:
+            snapshot.release()
+
+        if body is None:
+            self.send_error_json(404, 'Not found')
+            return
+        self.send_json(200, body)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path.strip('/') != 'refresh':
+            self.send_error_json(404, 'Not found')
+            return
+
+        crawl = first(parse_qs(url.query), 'crawl', '')
+        title_ids = [t for t in crawl.split(',') if t != '']
+        if self.server.start_refresh(title_ids):
+            self.send_json(202, json.dumps({'refreshing': True, 'crawl': title_ids}).encode())
+        else:
+            self.send_error_json(409, 'A refresh is already running')
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the series database as JSON.')
+    parser.add_argument('--db', default=got_query.DB_NAME, help=f'path to the database (default {got_query.DB_NAME})')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE, help='responses kept in the LRU cache')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args(argv)
+
+    try:
+        server = GotServer((args.host, args.port), args.db, args.cache_size)
+    except sqlite3.OperationalError:
+        print(f"[Error] Could not open {args.db}, run 'python got_query.py build' first", file=sys.stderr)
+        return 1
+    server.verbose = args.verbose
+
+    print(f"Serving {args.db} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())